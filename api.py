@@ -1,13 +1,60 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import datetime
+import json
+import logging
 import pandas as pd
-from typing import Any
+from typing import Any, Callable
 
-from config import CINC_API_URL
-from utils import rate_limited, AuthError
+from config import CINC_API_URL, DELIVERY_THREADS, CINC_RATE_LIMIT, REQUEST_TIMEOUT
+from utils import rate_limited, AuthError, TokenBucket
 from auth import refresh_token
 
+logger = logging.getLogger(__name__)
+
+# Lead columns read when building the CINC contact
+LEAD_FIELDS = (
+    "md5",
+    "first_name",
+    "last_name",
+    "email_1",
+    "phone_1",
+    "phone_2",
+    "phone_3",
+    "address",
+    "city",
+    "state",
+    "zip_code",
+)
+
+# Lead columns added to the pinned info note, with their labels
+NOTE_FIELD_MAP = {
+    "insight": "AI-Enhanced Insight",
+    "phone_1_dnc": "Cell Phone DNC Status",
+    "phone_2_dnc": "Home Phone DNC Status",
+    "phone_3_dnc": "Work Phone DNC Status",
+    "email_2": "Secondary Email",
+    "email_3": "Alternative Email",
+    "age": "Age",
+    "gender": "Gender",
+    "head_of_household": "Head of Household",
+    "birth_month_and_year": "Birth Month and Year",
+    "credit_range": "Credit Range",
+    "household_income": "Household Income",
+    "household_net_worth": "Household Net Worth",
+    "home_owner_status": "Home Owner Status",
+    "median_home_value": "Median Home Value",
+    "occupation": "Occupation",
+    "education": "Education Level",
+    "marital_status": "Marital Status",
+    "n_household_children": "Number of Children",
+    "n_household_adults": "Number of Adults",
+    "investments": "Investments",
+    "investment_type": "Investment Type",
+}
+
 class CINCDeliverer():
     """Delivers data to CINC CRM."""
 
@@ -20,7 +67,7 @@ class CINCDeliverer():
             listing_agent: str | None = None,
             partner: str | None = None,
             base_url: str = CINC_API_URL,
-            n_threads: int = 1,
+            n_threads: int = DELIVERY_THREADS,
         ):
         """
         Initialize the CINCDeliverer.
@@ -33,7 +80,7 @@ class CINCDeliverer():
             listing_agent (str, optional): The listing agent to be assigned to the lead. Defaults to None.
             partner (str, optional): The partner to be assigned to the lead. Defaults to None.
             base_url (str, optional): The base URL for the CINC API. Defaults to CINC_API_URL.
-            n_threads (int, optional): The number of threads to use for delivering leads. Defaults to 1.
+            n_threads (int, optional): The number of HTTP threads to use for delivering leads. Defaults to DELIVERY_THREADS.
         """
         
         self.access_token: str = access_token
@@ -43,6 +90,19 @@ class CINCDeliverer():
         self.primary_agent: str | None = primary_agent
         self.listing_agent: str | None = listing_agent
         self.partner: str | None = partner
+
+        # Agent assignments shared by every lead
+        self._assigned_agents: dict[str, dict[str, str | None]] = {
+            "primary_agent": {
+                "id": self.primary_agent,
+            },
+            "listing_agent": {
+                "id": self.listing_agent,
+            },
+            "partner": {
+                "id": self.partner,
+            },
+        }
         
         # Keep track of failed leads
         self.failed_leads: list[dict] = []
@@ -50,8 +110,29 @@ class CINCDeliverer():
         # Configuration stuff
         self.n_threads: int = n_threads
 
+        # Shared by this deliverer's threads, so a 429 pauses all of them but not other users' deliveries
+        self._rate_limiter: TokenBucket = TokenBucket(rate=CINC_RATE_LIMIT)
+
+        # Shared session so every lead reuses pooled keep-alive connections
+        self._session: requests.Session = requests.Session()
+        # GETs are retried with backoff on gateway errors and read failures. POSTs are only retried when
+        # the connection could not be made, since once the request is sent CINC may have created the lead.
+        # 429s are left to rate_limited() so they pause the shared bucket.
+        retries = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=["GET"],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=n_threads, pool_maxsize=n_threads, max_retries=retries)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._session.headers.update(self.api_headers)
+
         # Make sure API credentials are valid
         if not self._verify_api_credentials():
+            self.close()
             raise AuthError("Could not verify credentials for CINC delivery. Please re-authenticate.")
     
     def get_failed_leads(self) -> list[dict]:
@@ -63,6 +144,16 @@ class CINCDeliverer():
         """
         return self.failed_leads    
     
+    def close(self) -> None:
+        """Close the underlying HTTP session and its pooled connections."""
+        self._session.close()
+
+    def __enter__(self) -> "CINCDeliverer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+    
     @property
     def api_headers(self) -> dict:
         """
@@ -74,9 +165,10 @@ class CINCDeliverer():
         return {
             "Authorization": f"{self.access_token}",
             "Content-Type": "application/json",
+            "Accept": "application/json",
         }
     
-    @rate_limited()
+    @rate_limited("_rate_limiter")
     def _verify_api_credentials(self) -> bool:
         """
         Verify that the API credentials are valid. Refresh the token if necessary.
@@ -85,79 +177,89 @@ class CINCDeliverer():
             bool: True if the credentials are valid, False otherwise.
         """
                 
-        response = requests.get(
-            f"{self.base_url}/me",
-            headers=self.api_headers
-        )
+        response = self._session.get(f"{self.base_url}/me", timeout=REQUEST_TIMEOUT)
         
         if response.status_code == 401:
             self.access_token = refresh_token()
-            response = requests.get(
-                f"{self.base_url}/me",
-                headers=self.api_headers
-            )
+            self._session.headers.update(self.api_headers)
+            response = self._session.get(f"{self.base_url}/me", timeout=REQUEST_TIMEOUT)
             return response.ok
         elif response.ok:
             return True
         else:
             return False
     
-    def deliver(self, data: pd.DataFrame) -> list[dict]:
+    def deliver(
+            self,
+            data: pd.DataFrame,
+            progress_callback: Callable[[int, int], None] | None = None,
+        ) -> None:
         """
         Deliver the PII data to CINC.
 
+        CINC's /leads endpoint takes one lead per request, so leads are sent concurrently on a
+        pool of n_threads HTTP worker threads sharing one pooled session. The work is I/O-bound,
+        so threads spend their time waiting on the socket with the GIL released.
+
         Args:
-            pii_md5s (list[MD5WithPII]): A list of MD5WithPII objects containing the PII data to be delivered.
+            data (pd.DataFrame): A dataframe containing the PII data to be delivered, one lead per row.
+                Missing values (NaN/NA) are treated as empty.
+            progress_callback (Callable[[int, int], None], optional): Called from the calling thread with
+                (n_completed, n_total) as each lead finishes. Defaults to None.
 
-        Returns:
-            list[dict]: A list of response dictionaries from the CINC API for each delivered event.
+        Failed leads are recorded and can be retrieved with get_failed_leads(). Response bodies
+        are not kept. The lead dicts and one future per lead are still held until delivery finishes.
         """
         
+        # Build plain per-lead dicts from only the columns we read; missing values are dropped per lead
+        fields: list[str] = [field for field in (*LEAD_FIELDS, *NOTE_FIELD_MAP) if field in data.columns]
+        leads: list[dict] = data[fields].to_dict(orient="records")
+
+        # Batch timestamp
+        timestamp: str = datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
         with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
-            return list(executor.map(self._deliver_single_lead, ((row) for _, row in data.iterrows())))
+            futures = [executor.submit(self._deliver_single_lead, lead, timestamp) for lead in leads]
+            
+            for n_completed, _ in enumerate(as_completed(futures), start=1):
+                if progress_callback:
+                    progress_callback(n_completed, len(futures))
 
-    def _deliver_single_lead(self, lead: pd.Series) -> dict:
+    def _deliver_single_lead(self, lead: dict, timestamp: str) -> None:
         """
-        Deliver a single lead to CINC.
+        Deliver a single lead to CINC. Failures are recorded in failed_leads.
 
-        Args:
-            lead (pd.Series): A single row of the dataframe containing the PII data.
+        Nothing is returned, so completed futures in deliver() don't hold on to response bodies.
 
-        Returns:
-            dict: A response dictionary from the CINC API for the delivered event.
+        Args:
+            lead (dict): A single row of the dataframe containing the PII data, keyed by column name.
+            timestamp (str): The UTC registration timestamp shared by every lead in the batch.
         """
         try:
 
-            event_data = self._prepare_event_data(lead)   
+            event_data = self._prepare_event_data(lead, timestamp)   
             response = self._send_event(event_data)
-            print(
-                "trace", 
-                (
-                    f"Delivered lead: {lead.get("md5")}, "
-                    f"response_status: {response.get('status', 'unknown')}"
-                )
-            )
-            return response
+            logger.debug("Delivered lead: %s, response_status: %s", lead.get("md5"), response.get("status", "unknown"))
         except Exception as e:
             self.failed_leads.append({
                 "md5": lead.get("md5"),
                 "error": str(e),
             })
-            return {
-                "status": "failed",
-                "error": str(e),
-            }
 
-    def _prepare_event_data(self, lead: pd.Series) -> dict:
+    def _prepare_event_data(self, lead: dict, timestamp: str) -> dict:
         """
         Prepare the event data for a single row of the dataframe.
 
         Args:
-            lead (pd.Series): A single row of the dataframe containing the PII data.
+            lead (dict): A single row of the dataframe containing the PII data, keyed by column name.
+            timestamp (str): The UTC timestamp used for the registered and note created dates.
 
         Returns:
             dict: A dictionary containing the prepared event data for the CINC API.
         """
+
+        # Drop NaN/NA values so every lookup below sees a missing field as None
+        lead = {key: value for key, value in lead.items() if not pd.isna(value)}
                 
         # get all the required info
         md5: str | None = lead.get("md5")
@@ -172,7 +274,7 @@ class CINCDeliverer():
         state: str | None = lead.get("state")
         zip_code: str | None = str(lead.get("zip_code")) if lead.get("zip_code") else None
         
-        print("trace", f"Preparing event data for MD5: {md5}, first_name: {first_name}, last_name: {last_name}")
+        logger.debug("Preparing event data for MD5: %s", md5)
 
         # Prepare contact info
         contact_info: dict[str, Any] = {}
@@ -212,33 +314,8 @@ class CINCDeliverer():
         # Add Notes
         notes: list[dict[str, str]] = []
         
-        note_field_map = {
-            "insight": "AI-Enhanced Insight",
-            "phone_1_dnc": "Cell Phone DNC Status",
-            "phone_2_dnc": "Home Phone DNC Status",
-            "phone_3_dnc": "Work Phone DNC Status",
-            "email_2": "Secondary Email",
-            "email_3": "Alternative Email",
-            "age": "Age",
-            "gender": "Gender",
-            "head_of_household": "Head of Household",
-            "birth_month_and_year": "Birth Month and Year",
-            "credit_range": "Credit Range",
-            "household_income": "Household Income",
-            "household_net_worth": "Household Net Worth",
-            "home_owner_status": "Home Owner Status",
-            "median_home_value": "Median Home Value",
-            "occupation": "Occupation",
-            "education": "Education Level",
-            "marital_status": "Marital Status",
-            "n_household_children": "Number of Children",
-            "n_household_adults": "Number of Adults",
-            "investments": "Investments",
-            "investment_type": "Investment Type",  
-        }
-        
         note_lines = []
-        for key, label in note_field_map.items():
+        for key, label in NOTE_FIELD_MAP.items():
             value = lead.get(key)
             if pd.notna(value) and value != "":
                 note_lines.append(f"{label}: {value}")
@@ -248,41 +325,31 @@ class CINCDeliverer():
                 "content": "\n".join(note_lines),
                 "category": "info",
                 "created_by": "Real Intent",
-                "created_date": datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "created_date": timestamp,
                 "is_pinned": True,
             })  
             
         # Add tags as labels
         if self.tags:
             pass
-        if self.add_zip_tags and lead["zip_code"]:
+        if self.add_zip_tags and lead.get("zip_code"):
             pass        
             
         # Prepare event data according to CINC API schema
         event_data: dict[str, Any] = {
-            "registered_date": datetime.datetime.now(datetime.UTC).strftime("%Y-%m-%dT%H:%M:%SZ"),            
+            "registered_date": timestamp,            
             "info":{
                 "status": "unworked",
                 "source": "Real Intent",
                 "contact": contact_info,
             },
-            "assigned_agents":{
-                "primary_agent": {
-                    "id": self.primary_agent,
-                },
-                "listing_agent": {
-                    "id": self.listing_agent,
-                },
-                "partner": {
-                    "id": self.partner,
-                },
-            },
+            "assigned_agents": self._assigned_agents,
             "notes": notes,
         }
                         
         return event_data
 
-    @rate_limited()
+    @rate_limited("_rate_limiter")
     def _send_event(self, event_data: dict) -> dict:
         """
         Send an event to the CINC API.
@@ -296,21 +363,16 @@ class CINCDeliverer():
         Raises:
             requests.exceptions.HTTPError: If the API request fails.
         """
-        print(
-            "trace", 
-            (
-                f"Sending event to CINC API, "
-                f"person: {event_data}"
-            )
-        )
-
-        response = requests.post(
+        # Compact separators keep the payload small; Content-Type is already set on the session
+        response = self._session.post(
             f"{self.base_url}/leads", 
-            json=event_data, 
-            headers=self.api_headers
+            data=json.dumps(event_data, separators=(",", ":"), allow_nan=False),
+            timeout=REQUEST_TIMEOUT,
         )
         
-        print("trace", f"Raw response: {response.text}, status_code: {response.status_code}")
+        # Only decode the body for logging when the request failed
+        if not response.ok:
+            logger.debug("Error response: %s, status_code: %s", response.text, response.status_code)
                 
         response.raise_for_status()
         return response.json()
@@ -1,9 +1,21 @@
 import streamlit as st
+from io import BytesIO
 import pandas as pd
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
 from auth import authenticate, get_auth_url, reset_session
-from api import CINCDeliverer
+from api import CINCDeliverer, LEAD_FIELDS, NOTE_FIELD_MAP
 from utils import AuthError
 
+# Process-wide: applies to all pandas code imported here, including api.py's lead building
+pd.set_option("mode.copy_on_write", True)
+
 # Define global variables for column mappings
 COLUMN_MAPPINGS = {
     "first_name": "First Name",
@@ -19,10 +31,88 @@ COLUMN_MAPPINGS = {
     "zip_code": "Zip/Postal Code",
 }
 
+REQUIRED_COLUMNS = tuple(COLUMN_MAPPINGS.keys())
+REQUIRED_INDEX = pd.Index(REQUIRED_COLUMNS)
+
+# Only these columns are parsed from the upload: the CSV export fields plus everything the deliverer reads
+USED_COLUMNS = frozenset((*REQUIRED_COLUMNS, *LEAD_FIELDS, *NOTE_FIELD_MAP))
+
+# Parsed as strings so phones keep their exact digits and zips keep leading zeros (e.g. "02134")
+STRING_COLUMNS = ("phone_1", "phone_2", "phone_3", "zip_code")
+
 @st.cache_data
-def load_file(file):
-    return pd.read_csv(file)
+def load_file(file_bytes: bytes) -> pd.DataFrame:
+    # Read the header first so only columns that exist are requested; Arrow rejects missing ones
+    header = pd.read_csv(BytesIO(file_bytes), nrows=0).columns
+    usecols = [col for col in header if col in USED_COLUMNS]
+
+    if pa is not None:
+        # Arrow's multithreaded parser, with the string types applied while parsing. pd.read_csv(engine="pyarrow")
+        # only casts after Arrow has inferred int64, which drops leading zeros. Quoted insights may span lines.
+        try:
+            table = pa_csv.read_csv(
+                BytesIO(file_bytes),
+                parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+                convert_options=pa_csv.ConvertOptions(
+                    column_types=dict.fromkeys(STRING_COLUMNS, pa.string()),
+                    include_columns=usecols,
+                    strings_can_be_null=True,
+                ),
+            )
+            return table.to_pandas(types_mapper=pd.ArrowDtype)
+        except pa.ArrowInvalid:
+            pass  # Fall back to the more lenient C parser
+
+    return pd.read_csv(BytesIO(file_bytes), usecols=usecols, dtype=dict.fromkeys(STRING_COLUMNS, "string"))
+
+
+@st.cache_data(show_spinner=False)
+def convert_file(file_bytes: bytes) -> pd.DataFrame:
+    # Cached on the upload alone; the optional fields are cheap to add per rerun and aren't part of the key
+    df = load_file(file_bytes)
+
+    df_cincpro = df.loc[:, list(REQUIRED_COLUMNS)].rename(columns=COLUMN_MAPPINGS)
     
+    # Add validation columns
+    has_phone = df_cincpro[["Cell Phone", "Home Phone", "Work Phone"]].notna().to_numpy().any(axis=1)
+    df_cincpro["Valid Cell Phone"] = np.where(has_phone, "YES", "")
+
+    if 'insight' in df.columns:
+        df_cincpro['Insight'] = df['insight'].astype("string")
+
+    return df_cincpro
+
+
+def add_optional_columns(
+    file_bytes: bytes, agent_assigned: str, listing_agent: str, partner: str, pipeline: str
+) -> pd.DataFrame:
+    # Optional fields and Source
+    optional_columns = {
+        'Agent Assigned': agent_assigned,
+        'Listing Agent': listing_agent,
+        'Partner': partner,
+        'Pipeline': pipeline,
+    }
+    return convert_file(file_bytes).assign(
+        **{name: value for name, value in optional_columns.items() if value},
+        Source='Real Intent',
+    )
+
+
+# Keyed on the upload and the option values, not the frame, so reruns don't hash every cell; max_entries bounds
+# how many encoded copies are kept as the options change
+@st.cache_data(show_spinner=False, max_entries=5)
+def encode_csv(file_bytes: bytes, agent_assigned: str, listing_agent: str, partner: str, pipeline: str) -> bytes:
+    df_cincpro = add_optional_columns(file_bytes, agent_assigned, listing_agent, partner, pipeline)
+
+    if pa is None:
+        return df_cincpro.to_csv(index=False).encode('utf-8')
+
+    buffer = BytesIO()
+    pa_csv.write_csv(pa.Table.from_pandas(df_cincpro, preserve_index=False), buffer)
+    return buffer.getvalue()
+
+
 def main():
     st.title('Real Intent to CINC Converter/Deliverer')
 
@@ -32,7 +122,8 @@ def main():
     
     if "code" in st.query_params and "state" in st.query_params: 
         try:
-            authenticate(st.query_params["code"], st.query_params["state"])      
+            with st.spinner("Authenticating with CINC..."):
+                authenticate(st.query_params["code"], st.query_params["state"])      
             st.query_params.clear()   
         except AuthError as e:
             st.warning(f"Authentication Error: {e.message}") 
@@ -68,31 +159,15 @@ def main():
     # -- File Upload and Processing --
     
     if uploaded_file is not None:
-        df = load_file(uploaded_file)
+        file_bytes = uploaded_file.getvalue()
+        df = load_file(file_bytes)
         
         # Check if required columns are in the dataframe
-        missing_columns = [col for col in COLUMN_MAPPINGS.keys() if col not in df.columns]
+        missing_columns = REQUIRED_INDEX.difference(df.columns, sort=False)
         
-        if not missing_columns:
+        if missing_columns.empty:
 
-            df_cincpro = df[list(COLUMN_MAPPINGS.keys())].rename(columns=COLUMN_MAPPINGS)
-            
-            # Add validation columns
-            df_cincpro["Valid Cell Phone"] = df_cincpro[["Cell Phone", "Home Phone", "Work Phone"]].apply(lambda x: "YES" if x.notna().any() else "", axis=1)
-
-            if 'insight' in df.columns:
-                df_cincpro['Insight'] = df['insight'].apply(lambda x: f"{x}")
-                
-            if agent_assigned:
-                df_cincpro['Agent Assigned'] = agent_assigned
-            if listing_agent:
-                df_cincpro['Listing Agent'] = listing_agent
-            if partner:
-                df_cincpro['Partner'] = partner
-            if pipeline:
-                df_cincpro['Pipeline'] = pipeline
-
-            df_cincpro['Source'] = 'Real Intent'
+            df_cincpro = add_optional_columns(file_bytes, agent_assigned, listing_agent, partner, pipeline)
 
             # Display the resulting dataframe
             st.write("Converted DataFrame:")
@@ -104,10 +179,9 @@ def main():
             # -- Download CSV --
 
             if option == "Download CSV":
-                csv = df_cincpro.to_csv(index=False).encode('utf-8')
                 st.download_button(
                     label="Download converted CSV",
-                    data=csv,
+                    data=encode_csv(file_bytes, agent_assigned, listing_agent, partner, pipeline),
                     file_name='converted_file.csv',
                     mime='text/csv',
                 )
@@ -126,13 +200,16 @@ def main():
                                 primary_agent=agent_assigned,
                                 listing_agent=listing_agent,
                                 partner=partner,
-                                n_threads=5,
                             )
                         
-                            deliver_df = df.replace({float('nan'): None}, inplace=False)
-                        
-                        with st.spinner("Delivering leads..."):
-                            deliverer.deliver(deliver_df)
+                        with st.spinner("Delivering leads..."), deliverer:
+                            progress_bar = st.progress(0.0)
+                            deliverer.deliver(
+                                df,
+                                progress_callback=lambda n_completed, n_total: progress_bar.progress(
+                                    n_completed / n_total, text=f"Delivered {n_completed} of {n_total} leads"
+                                ),
+                            )
                             failed_leads = deliverer.get_failed_leads()                     
 
                             if failed_leads:
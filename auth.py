@@ -1,12 +1,34 @@
+import http.cookiejar
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import urllib.parse
-import random
-import string
+import secrets
 import streamlit as st
 
-from config import CLIENT_ID, CLIENT_SECRET, CINC_AUTH_URL, REDIRECT_URI
+from config import CLIENT_ID, CLIENT_SECRET, CINC_AUTH_URL, REDIRECT_URI, REQUEST_TIMEOUT
 from utils import AuthError
 
+@st.cache_resource
+def get_http() -> requests.Session:
+    """
+    Get the pooled session used for the OAuth calls.
+
+    Cached as a Streamlit resource, so the connection pool is shared across reruns and sessions
+    in this server process. Cookies are never stored, so nothing one user receives is sent
+    on another user's requests. Status retries only apply to idempotent methods; the token
+    POSTs are only retried on connection errors.
+    """
+    session = requests.Session()
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    session.mount("https://", HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]),
+    ))
+    session.headers.update({"Accept": "application/json"})
+    return session
+
 def reset_session():
     st.session_state["authenticated"] = False
     st.session_state["access_token"] = None
@@ -16,7 +38,7 @@ def reset_session():
 
 
 def generate_state():
-    return ''.join(random.choices(string.ascii_letters + string.digits, k=16))
+    return secrets.token_urlsafe(12)
 
 
 def get_auth_url():
@@ -45,18 +67,19 @@ def exchange_code_for_token(code):
     }
         
 
-    response = requests.post(f"{CINC_AUTH_URL}/token", data=data)
+    response = get_http().post(f"{CINC_AUTH_URL}/token", data=data, timeout=REQUEST_TIMEOUT)
     response.raise_for_status()
     
-    access_token = response.json().get("access_token", None)
-    refresh_token = response.json().get("refresh_token", None)
+    payload = response.json()
+    access_token = payload.get("access_token", None)
+    new_refresh_token = payload.get("refresh_token", None)
     
-    if not access_token or not refresh_token:
+    if not access_token or not new_refresh_token:
         reset_session()
         raise AuthError("Access or Refresh token not found in response.")
 
     st.session_state["access_token"] = access_token
-    st.session_state["refresh_token"] = refresh_token
+    st.session_state["refresh_token"] = new_refresh_token
 
 
 def refresh_token() -> str:
@@ -73,14 +96,15 @@ def refresh_token() -> str:
         'client_secret': CLIENT_SECRET,
     }
 
-    response = requests.post(f"{CINC_AUTH_URL}/token", data=data)
+    response = get_http().post(f"{CINC_AUTH_URL}/token", data=data, timeout=REQUEST_TIMEOUT)
         
     if not response.ok:
         reset_session()
         raise AuthError("Failed to refresh token.")
     
-    new_access_token = response.json().get("access_token", None)
-    new_refresh_token = response.json().get("refresh_token", None)
+    payload = response.json()
+    new_access_token = payload.get("access_token", None)
+    new_refresh_token = payload.get("refresh_token", None)
     
     if not new_access_token:
         reset_session()
@@ -4,11 +4,47 @@ import streamlit as st
 
 load_dotenv()
 
+def _get_setting(key: str, default: str | None = None, required: bool = False) -> str | None:
+    """
+    Look up a setting in the environment, falling back to Streamlit secrets.
+
+    Read once per key at import. Optional settings fall back to the default when secrets are
+    missing or unreadable, so the module stays importable. Required settings raise instead,
+    naming the key, rather than silently becoming None.
+    """
+    value = os.getenv(key)
+    if value:
+        return value
+    
+    try:
+        value = st.secrets.get(key, default)
+    except FileNotFoundError as e:
+        # Also raised for a secrets.toml that exists but can't be parsed
+        if required:
+            raise RuntimeError(f"Required setting {key} is not set and Streamlit secrets could not be loaded: {e}") from e
+        return default
+
+    if required and not value:
+        raise RuntimeError(f"Required setting {key} is not set in the environment or Streamlit secrets.")
+    return value
+
 # For OAuth2.0 authentication
-CINC_AUTH_URL = os.getenv("CINC_AUTH_URL") or st.secrets["CINC_AUTH_URL"]
-CLIENT_ID = os.getenv("CLIENT_ID") or st.secrets["CLIENT_ID"]
-CLIENT_SECRET = os.getenv("CLIENT_SECRET") or st.secrets["CLIENT_SECRET"]
-REDIRECT_URI = os.getenv("REDIRECT_URI") or st.secrets["REDIRECT_URI"]
+CINC_AUTH_URL = _get_setting("CINC_AUTH_URL", required=True)
+CLIENT_ID = _get_setting("CLIENT_ID", required=True)
+CLIENT_SECRET = _get_setting("CLIENT_SECRET", required=True)
+REDIRECT_URI = _get_setting("REDIRECT_URI", required=True)
 
 # For API requests
-CINC_API_URL = os.getenv("CINC_API_URL") or st.secrets["CINC_API_URL"]
+CINC_API_URL = _get_setting("CINC_API_URL", required=True)
+
+# (connect, read) timeout in seconds for CINC requests, so a hung connection can't pin a thread
+REQUEST_TIMEOUT = (3.05, 30)
+
+# Number of HTTP worker threads used for lead delivery. Delivery is I/O-bound, so this
+# is the number of concurrent requests to CINC, not a CPU-bound worker count.
+DELIVERY_THREADS = int(_get_setting("DELIVERY_THREADS", "10"))
+
+# Optional client-side cap, in requests per second, on each delivery's calls to the CINC API.
+# Unset by default: delivery is only held back when CINC answers with a 429.
+_cinc_rate_limit = _get_setting("CINC_RATE_LIMIT")
+CINC_RATE_LIMIT = float(_cinc_rate_limit) if _cinc_rate_limit else None
@@ -1,30 +1,93 @@
-import requests, time, random
+import requests, time, random, logging, threading
 from functools import wraps
 
+logger = logging.getLogger(__name__)
+
 class AuthError(Exception):
     """Custom exception for authentication errors."""
     def __init__(self, message):
         super().__init__(message)
         self.message = message
 
-def rate_limited():
+class TokenBucket():
+    """
+    Thread-safe token bucket shared by every thread calling the same API.
+
+    Without a rate it never throttles and only holds threads back after a pause(), e.g. on a 429.
+    """
+
+    def __init__(self, rate: float | None = None, capacity: float | None = None):
+        """
+        Initialize the TokenBucket.
+
+        Args:
+            rate (float, optional): The number of requests allowed per second. Defaults to None (no throttling).
+            capacity (float, optional): The maximum burst size. Defaults to rate (at least 1).
+
+        Raises:
+            ValueError: If rate or capacity is not greater than 0.
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError(f"Rate must be greater than 0, got {rate}.")
+        if capacity is not None and capacity <= 0:
+            raise ValueError(f"Capacity must be greater than 0, got {capacity}.")
+        
+        self.rate: float | None = rate
+        self.capacity: float = capacity if capacity is not None else max(1.0, rate or 1.0)
+        
+        self._tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+        self._paused_until: float = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, sleeping until it is available. The lock is not held while sleeping."""
+        with self._lock:
+            now = time.monotonic()
+            wait: float = max(0.0, self._paused_until - now)
+            
+            if self.rate is not None:
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                self._tokens -= 1
+                if self._tokens < 0:
+                    wait = max(wait, -self._tokens / self.rate)
+        
+        if wait:
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every thread for at least the given number of seconds, e.g. after a 429."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+def rate_limited(bucket_attr: str | None = None):
     """
     Decorator to handle rate limiting for CRM API calls.
     
     Args:
+        bucket_attr (str, optional): Name of a TokenBucket attribute on the decorated method's instance.
+            A token is taken from it before every attempt, and a 429 response pauses the whole bucket,
+            not just the calling thread. Defaults to None.
     """
     def decorator(func: callable):
         @wraps(func)
         def wrapper(*args, **kwargs):
+            bucket: TokenBucket | None = getattr(args[0], bucket_attr) if bucket_attr else None
             for _ in range(10):
+                if bucket:
+                    bucket.acquire()
                 try:
                     return func(*args, **kwargs)
                 except requests.exceptions.HTTPError as e:
                     if e.response.status_code == 429:  # Too Many Requests
                         retry_after = int(e.response.headers.get('Retry-After', 10))
                         sleep_delay: float = retry_after + (random.randint(50, 100) / 100)
-                        print("warn", f"Rate limit hit. Retrying in {sleep_delay} seconds.")
-                        time.sleep(sleep_delay)
+                        logger.warning("Rate limit hit. Retrying in %s seconds.", sleep_delay)
+                        if bucket:
+                            bucket.pause(sleep_delay)
+                        else:
+                            time.sleep(sleep_delay)
                     else:
                         raise
             raise Exception(f"Max retries (10) exceeded due to rate limiting.")